@@ -1,7 +1,11 @@
+import io
 import os
-import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import h5py
+import hdf5plugin
 import numpy as np
+import orjson
+import tifffile
 from scipy.spatial.transform import Rotation
 from PIL import Image
 import logging
@@ -11,121 +15,250 @@ logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+# Depth maps are clipped to the cameras' max render distance before quantization
+MAX_DEPTH = 100.0
 
-def create_transformation_matrix(position, euler_angles):
+
+def create_transformation_matrices(positions, euler_angles):
     """
-    Creates a 4x4 homogeneous transformation matrix from position and Euler angles.
+    Creates a stack of 4x4 homogeneous transformation matrices from N positions and N sets of Euler angles.
     """
-    r = Rotation.from_euler("xyz", euler_angles, degrees=True)
-    rotation_matrix = r.as_matrix()
-    transformation_matrix = np.eye(4)
-    transformation_matrix[:3, :3] = rotation_matrix
-    transformation_matrix[:3, 3] = position
-    return transformation_matrix
+    positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+    euler_angles = np.asarray(euler_angles, dtype=float).reshape(-1, 3)
+    transformation_matrices = np.broadcast_to(np.eye(4), (len(positions), 4, 4)).copy()
+    if len(positions):
+        r = Rotation.from_euler("xyz", euler_angles, degrees=True)
+        transformation_matrices[:, :3, :3] = r.as_matrix()
+        transformation_matrices[:, :3, 3] = positions
+    return transformation_matrices
 
 
 def read_image(image_path):
     """
     Reads an image from a file and converts it to a numpy array.
+    TIFFs (the depth maps) are read with tifffile, which is much faster than PIL for float data.
+    """
+    if image_path.lower().endswith((".tif", ".tiff")):
+        img = tifffile.imread(image_path)
+        # Kubric writes single channel TIFFs as (H, W, 1), PIL reads them as (H, W)
+        if img.ndim == 3 and img.shape[-1] == 1:
+            img = np.squeeze(img, axis=-1)
+        return img
+    return np.asarray(Image.open(image_path))
+
+
+def read_depth(depth_path):
+    """
+    Reads a depth map and quantizes it to uint16, clipped to the maximum render distance.
+    """
+    depth_image = np.clip(read_image(depth_path), 0, MAX_DEPTH)
+    return np.round(depth_image * (65535 / MAX_DEPTH)).astype(np.uint16)
+
+
+def read_png(image_path):
+    """
+    Reads the encoded bytes of a PNG along with the shape of the decoded image.
+    Only the PNG header is parsed, the pixel data is left compressed.
+    """
+    with open(image_path, "rb") as f:
+        raw = f.read()
+    img = Image.open(io.BytesIO(raw))
+    shape = (img.height, img.width, len(img.getbands()))
+    return raw, shape
+
+
+def load_scene(scene_path, executor):
+    """
+    Reads the metadata of a scene and its cameras, and submits the image reads to the executor.
     """
-    img = Image.open(image_path)
-    return np.array(img)
+    with open(os.path.join(scene_path, "metadata.json"), "rb") as f:
+        scene_metadata = orjson.loads(f.read())
+
+    cameras = []
+    with os.scandir(scene_path) as entries:
+        camera_dirs = [
+            e.name for e in entries if e.is_dir() and e.name.startswith("cam_")
+        ]
+    for cam_dir in camera_dirs:
+        camera_path = os.path.join(scene_path, cam_dir, "metadata.json")
+        if not os.path.exists(camera_path):
+            continue
+
+        with open(camera_path, "rb") as f:
+            camera_metadata = orjson.loads(f.read())
+
+        rgba_path = os.path.join(scene_path, cam_dir, camera_metadata["rgba_path"])
+        depth_path = os.path.join(scene_path, cam_dir, camera_metadata["depth_path"])
+
+        rgba_future = (
+            executor.submit(read_png, rgba_path) if os.path.exists(rgba_path) else None
+        )
+        depth_future = (
+            executor.submit(read_depth, depth_path)
+            if os.path.exists(depth_path)
+            else None
+        )
+        cameras.append((camera_metadata, rgba_future, depth_future))
+
+    return {"path": scene_path, "metadata": scene_metadata, "cameras": cameras}
 
 
-def process_scene(scene_path, hdf5_group):
+def process_scene(scene, hdf5_group):
     """
-    Processes a single scene and stores its metadata, objects, and camera data into an HDF5 group.
+    Stores the metadata, objects, and camera data of a loaded scene into an HDF5 group.
+    Images are written as their reads complete; h5py writes stay on the calling thread.
     """
-    logging.info(f"Processing scene: {scene_path}")
+    logging.info(f"Processing scene: {scene['path']}")
 
-    with open(os.path.join(scene_path, "metadata.json"), "r") as f:
-        scene_metadata = json.load(f)
+    scene_metadata = scene["metadata"]
 
-    hdf5_group.attrs["scene_index"] = scene_metadata["scene_index"]
-    hdf5_group.attrs["warehouse_dimensions"] = tuple(
-        scene_metadata["warehouse_dimensions"].values()
+    hdf5_group.attrs.update(
+        {
+            "scene_index": scene_metadata["scene_index"],
+            "warehouse_dimensions": np.asarray(
+                list(scene_metadata["warehouse_dimensions"].values()),
+                dtype=np.float32,
+            ),
+            "ambient_light": np.asarray(
+                scene_metadata["lighting_conditions"]["ambient_color"],
+                dtype=np.float32,
+            ),
+            "num_lights": scene_metadata["lighting_conditions"]["num_lights"],
+        }
     )
-    hdf5_group.attrs["ambient_light"] = tuple(
-        scene_metadata["lighting_conditions"]["ambient_color"]
+
+    objects = scene_metadata["objects"]
+    # Row i of object_transforms is the transformation matrix of object_i
+    object_transforms = create_transformation_matrices(
+        [obj["position"] for obj in objects], [obj["rotation"] for obj in objects]
     )
-    hdf5_group.attrs["num_lights"] = scene_metadata["lighting_conditions"]["num_lights"]
+    hdf5_group.create_dataset("object_transforms", data=object_transforms)
 
     objects_group = hdf5_group.create_group("objects")
-    for obj_index, obj in enumerate(scene_metadata["objects"]):
+    for obj_index, obj in enumerate(objects):
         obj_key = f"object_{obj_index}"
         obj_group = objects_group.create_group(obj_key)
 
-        transformation_matrix = create_transformation_matrix(
-            obj["position"], obj["rotation"]
+        obj_group.attrs.update(
+            {
+                "transform_index": obj_index,
+                "name": obj["name"],
+                "position": np.asarray(obj["position"], dtype=np.float32),
+                "scale": np.asarray(obj["scale"], dtype=np.float32),
+                "rotation": np.asarray(obj["rotation"], dtype=np.float32),
+            }
         )
-        obj_group.create_dataset("transformation_matrix", data=transformation_matrix)
 
-        obj_group.attrs["name"] = obj["name"]
-        obj_group.attrs["position"] = obj["position"]
-        obj_group.attrs["scale"] = obj["scale"]
-        obj_group.attrs["rotation"] = obj["rotation"]
+    # Camera directories are not listed in index order, so each camera group records
+    # its row of camera_transforms
+    cameras = scene["cameras"]
+    camera_transforms = create_transformation_matrices(
+        [camera_metadata["relative_position_xyz"] for camera_metadata, _, _ in cameras],
+        [
+            camera_metadata["relative_orientation_xyz"]
+            for camera_metadata, _, _ in cameras
+        ],
+    )
+    hdf5_group.create_dataset("camera_transforms", data=camera_transforms)
 
     cameras_group = hdf5_group.create_group("cameras")
-    camera_dirs = [d for d in os.listdir(scene_path) if d.startswith("cam_")]
-
-    for cam_dir in camera_dirs:
-        camera_path = os.path.join(scene_path, cam_dir, "metadata.json")
-        if not os.path.exists(camera_path):
-            continue
-
-        with open(camera_path, "r") as f:
-            camera_metadata = json.load(f)
-
+    for transform_index, (camera_metadata, rgba_future, depth_future) in enumerate(
+        cameras
+    ):
         cam_key = f"camera_{camera_metadata['camera_index']}"
         cam_group = cameras_group.create_group(cam_key)
 
-        transformation_matrix = create_transformation_matrix(
-            camera_metadata["relative_position_xyz"],
-            camera_metadata["relative_orientation_xyz"],
+        cam_group.attrs.update(
+            {
+                "transform_index": transform_index,
+                "position": np.asarray(camera_metadata["position"], dtype=np.float32),
+                "relative_position": np.asarray(
+                    camera_metadata["relative_position_xyz"], dtype=np.float32
+                ),
+                "relative_orientation": np.asarray(
+                    camera_metadata["relative_orientation_xyz"], dtype=np.float32
+                ),
+                "focal_length": camera_metadata["focal_length"],
+            }
         )
-        cam_group.create_dataset("transformation_matrix", data=transformation_matrix)
 
-        cam_group.attrs["position"] = camera_metadata["position"]
-        cam_group.attrs["relative_position"] = camera_metadata["relative_position_xyz"]
-        cam_group.attrs["relative_orientation"] = camera_metadata[
-            "relative_orientation_xyz"
-        ]
-        cam_group.attrs["focal_length"] = camera_metadata["focal_length"]
+        if rgba_future is not None:
+            # The PNG is already compressed, so its bytes are written as the dataset's
+            # only chunk, bypassing the HDF5 filter pipeline, and decoded on read
+            rgba_png, rgba_shape = rgba_future.result()
+            rgba_dataset = cam_group.create_dataset(
+                "rgba_png",
+                shape=(len(rgba_png),),
+                dtype=np.uint8,
+                chunks=(len(rgba_png),),
+            )
+            rgba_dataset.id.write_direct_chunk((0,), rgba_png)
+            rgba_dataset.attrs["shape"] = rgba_shape
 
-        rgba_path = os.path.join(scene_path, cam_dir, camera_metadata["rgba_path"])
-        depth_path = os.path.join(scene_path, cam_dir, camera_metadata["depth_path"])
+        if depth_future is not None:
+            depth_image = depth_future.result()
+            # One chunk per image, Blosc applies the byte shuffle to the depth data
+            depth_dataset = cam_group.create_dataset(
+                "depth_image",
+                data=depth_image,
+                chunks=depth_image.shape,
+                **hdf5plugin.Blosc(
+                    cname="lz4", clevel=5, shuffle=hdf5plugin.Blosc.SHUFFLE
+                ),
+            )
+            # Multiply the stored values by the scale to recover the depth in meters
+            depth_dataset.attrs["scale"] = MAX_DEPTH / 65535
 
-        if os.path.exists(rgba_path):
-            rgba_image = read_image(rgba_path)
-            cam_group.create_dataset("rgba_image", data=rgba_image, compression="gzip")
 
-        if os.path.exists(depth_path):
-            depth_image = read_image(depth_path)
-            cam_group.create_dataset(
-                "depth_image", data=depth_image, compression="gzip"
-            )
+def convert_scene(scene_path, output_path, num_threads=4):
+    """
+    Converts a single scene into its own HDF5 file, with the scene stored at the root group.
+    """
+    with ThreadPoolExecutor(max_workers=num_threads) as executor, h5py.File(
+        output_path, "w"
+    ) as hdf5_file:
+        process_scene(load_scene(scene_path, executor), hdf5_file)
+    return output_path
 
 
-def convert_to_hdf5(data_root, output_path):
+def convert_to_hdf5(data_root, output_path, max_workers=None):
     """
     Converts a directory of scenes and cameras into a single HDF5 file.
+    Scenes are converted in parallel into one file each, which are then linked into the output file.
     """
     logging.info(
         f"Starting conversion to HDF5. Data root: {data_root}, Output path: {output_path}"
     )
+    with os.scandir(data_root) as entries:
+        scene_dirs = [
+            e.name for e in entries if e.is_dir() and e.name.startswith("scene_")
+        ]
+
+    output_base = os.path.splitext(output_path)[0]
+    scene_outputs = [f"{output_base}_{scene_dir}.h5" for scene_dir in scene_dirs]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        list(
+            executor.map(
+                convert_scene,
+                [os.path.join(data_root, scene_dir) for scene_dir in scene_dirs],
+                scene_outputs,
+            )
+        )
+
+    # The scene files sit next to the output file, so link them by file name
     with h5py.File(output_path, "w") as hdf5_file:
-        scene_dirs = [d for d in os.listdir(data_root) if d.startswith("scene_")]
-        for scene_dir in scene_dirs:
-            scene_path = os.path.join(data_root, scene_dir)
-            scene_group = hdf5_file.create_group(scene_dir)
-            process_scene(scene_path, scene_group)
+        for scene_dir, scene_output in zip(scene_dirs, scene_outputs):
+            hdf5_file[scene_dir] = h5py.ExternalLink(
+                os.path.basename(scene_output), "/"
+            )
 
     logging.info(f"HDF5 file created at {output_path}")
 
 
-# Paths
-data_root = "output"  # Replace with the path to your data
-output_path = "dataset.h5"
+if __name__ == "__main__":
+    # Paths
+    data_root = "output"  # Replace with the path to your data
+    output_path = "dataset.h5"
 
-# Convert the dataset to HDF5 format
-convert_to_hdf5(data_root, output_path)
+    # Convert the dataset to HDF5 format
+    convert_to_hdf5(data_root, output_path)
@@ -5,14 +5,18 @@ import os
 import random
 from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 from scipy.spatial.transform import Rotation
 
 import kubric as kb
 from kubric.renderer.blender import Blender as KubricRenderer
 from warehouse_utils import (
     apply_texture,
+    clear_texture_caches,
+    directory_mtimes,
     discover_assets,
     discover_textures,
+    remove_unused_data,
 )
 
 logging.basicConfig(level=logging.DEBUG)
@@ -29,18 +33,67 @@ RANGES = {
     "forklift": (5, 10),
 }
 
-# Discover assets and textures
-ASSET_CATEGORIES = {
-    "pallet": discover_assets(os.path.join(ASSET_BASE_PATH, "pallet")),
-    "rack": discover_assets(os.path.join(ASSET_BASE_PATH, "rack")),
-    "forklift": discover_assets(os.path.join(ASSET_BASE_PATH, "forklift")),
-}
-TEXTURE_CATEGORIES = {
-    "wood": discover_textures(os.path.join(ASSET_BASE_PATH, "wood")),
-    "metal": discover_textures(os.path.join(ASSET_BASE_PATH, "metal")),
-    "plastic": discover_textures(os.path.join(ASSET_BASE_PATH, "plastic")),
-    "floor": discover_textures(os.path.join(ASSET_BASE_PATH, "floor")),
-}
+# Discovered assets and textures are cached here along with the modification time of
+# every directory in each category tree. They are rediscovered when a category
+# directory appears or disappears, or when any directory in a tree (i.e. a file or
+# subfolder inside it) is added, removed or renamed. Exported so worker processes
+# read the same manifest.
+ASSET_MANIFEST_PATH = os.environ.setdefault(
+    "ASSET_MANIFEST_PATH", os.path.join(ASSET_BASE_PATH, ".manifest.json")
+)
+ASSET_CATEGORY_NAMES = ("pallet", "rack", "forklift")
+TEXTURE_CATEGORY_NAMES = ("wood", "metal", "plastic", "floor")
+
+
+def category_mtimes():
+    """Returns the directory modification times of each category tree, None if it is missing."""
+    mtimes = {}
+    for category in ASSET_CATEGORY_NAMES + TEXTURE_CATEGORY_NAMES:
+        path = os.path.join(ASSET_BASE_PATH, category)
+        mtimes[category] = directory_mtimes(path) if os.path.isdir(path) else None
+    return mtimes
+
+
+def load_asset_manifest(manifest_path):
+    """Loads the asset and texture categories, discovering and caching them if needed."""
+    mtimes = category_mtimes()
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("mtimes") == mtimes:
+            return manifest["assets"], manifest["textures"]
+
+    asset_categories = {
+        category: discover_assets(os.path.join(ASSET_BASE_PATH, category))
+        for category in ASSET_CATEGORY_NAMES
+    }
+    texture_categories = {
+        category: discover_textures(os.path.join(ASSET_BASE_PATH, category))
+        for category in TEXTURE_CATEGORY_NAMES
+    }
+
+    # Don't cache an incomplete asset tree, it is most likely still being set up
+    complete = all(asset_categories.values()) and all(texture_categories.values())
+    if complete and os.path.isdir(os.path.dirname(manifest_path)):
+        with open(manifest_path, "w") as f:
+            json.dump(
+                {
+                    "mtimes": mtimes,
+                    "assets": asset_categories,
+                    "textures": texture_categories,
+                },
+                f,
+                indent=4,
+            )
+
+    return asset_categories, texture_categories
+
+
+ASSET_CATEGORIES, TEXTURE_CATEGORIES = load_asset_manifest(ASSET_MANIFEST_PATH)
+
+# Per-process scene and renderer, set up once by init_worker to avoid booting Blender per scene
+_SCENE = None
+_RENDERER = None
 
 
 def setup_building(scene):
@@ -221,27 +274,26 @@ def place_pallet(scene, dims):
 
 def setup_cameras(target_position, num_angles, distances):
     """Places cameras around the target at specified angles and distances."""
+    angles = np.linspace(0, 2 * np.pi, num_angles, endpoint=False)
+    distances = np.asarray(distances, dtype=float)
+    # Rows are angles and columns are distances, matching the order of the cameras
+    xs = target_position[0] + np.outer(np.cos(angles), distances)
+    ys = target_position[1] + np.outer(np.sin(angles), distances)
+
     cameras = []
-    for angle in ((360 / num_angles) * i for i in range(num_angles)):
-        for distance in distances:
-            x = target_position[0] + distance * math.cos(math.radians(angle))
-            y = target_position[1] + distance * math.sin(math.radians(angle))
-            z = max(target_position[2] + random.uniform(-0.2, 0.2), 0.1)
-            camera = kb.PerspectiveCamera(
-                position=(x, y, z),
-                look_at=target_position,
-                focal_length=random.gauss(*CAMERA_FOCAL_LENGTH_GAUSSIAN),
-                min_render_distance=0.1,
-                max_render_distance=100.0,
-            )
-            cameras.append(camera)
+    for x, y in zip(xs.ravel().tolist(), ys.ravel().tolist()):
+        z = max(target_position[2] + random.uniform(-0.2, 0.2), 0.1)
+        camera = kb.PerspectiveCamera(
+            position=(x, y, z),
+            look_at=target_position,
+            focal_length=random.gauss(*CAMERA_FOCAL_LENGTH_GAUSSIAN),
+            min_render_distance=0.1,
+            max_render_distance=100.0,
+        )
+        cameras.append(camera)
     return cameras
 
 
-def map_float(iter):
-    return map(float, iter)
-
-
 def save_render_data(output_dir, scene_index, camera_index, camera, pallet, renderer):
     """Saves the rendered data and metadata for each camera in the scene."""
     frame = renderer.render_still()
@@ -262,16 +314,17 @@ def save_render_data(output_dir, scene_index, camera_index, camera, pallet, rend
     segmentation_path = os.path.join(camera_dir, "segmentation.png")
     kb.write_palette_png(frame["segmentation"], segmentation_path)
 
-    relative_position = tuple(
-        float(p - c) for p, c in zip(pallet.position, camera.position)
-    )
+    relative_position = (
+        np.asarray(pallet.position, dtype=float)
+        - np.asarray(camera.position, dtype=float)
+    ).tolist()
     relative_orientation = Rotation.from_quat(
         camera.quaternion
     ).inv() * Rotation.from_quat(pallet.quaternion)
 
     camera_metadata = {
         "camera_index": camera_index,
-        "position": list(map(float, camera.position)),
+        "position": np.asarray(camera.position, dtype=float).tolist(),
         "relative_position_xyz": relative_position,
         "relative_orientation_xyz": relative_orientation.as_euler(
             "xyz", degrees=True
@@ -285,11 +338,30 @@ def save_render_data(output_dir, scene_index, camera_index, camera, pallet, rend
         json.dump(camera_metadata, f, indent=4)
 
 
+def init_worker():
+    """Creates the scene and renderer reused for every scene generated by this process."""
+    global _SCENE, _RENDERER
+    _SCENE = kb.Scene(resolution=(1280, 720), frame_start=0, frame_end=1)
+    _RENDERER = KubricRenderer(_SCENE)
+    # The renderer resets the Blender data, invalidating any cached images
+    clear_texture_caches()
+
+
+def reset_scene(scene):
+    """Removes all assets of the previous scene, keeping the Blender context alive."""
+    for asset in scene.assets:
+        scene.remove(asset)
+    remove_unused_data()
+
+
 def generate_scene(output_dir, scene_index, num_angles, distances):
     """Generates a single warehouse scene."""
     logging.info(f"Generating scene {scene_index}")
-    scene = kb.Scene(resolution=(1280, 720), frame_start=0, frame_end=1)
-    renderer = KubricRenderer(scene)
+    if _SCENE is None:
+        init_worker()
+    scene = _SCENE
+    renderer = _RENDERER
+    reset_scene(scene)
 
     dims = setup_building(scene)
     add_random_lighting(scene, num_lights=random.randint(5, 10), warehouse_dims=dims)
@@ -318,22 +390,39 @@ def generate_scene(output_dir, scene_index, num_angles, distances):
     scene_dir = os.path.join(output_dir, f"scene_{scene_index}")
     os.makedirs(scene_dir, exist_ok=True)
 
+    physical_objects = [o for o in scene.assets if isinstance(o, kb.PhysicalObject)]
+    rotations = (
+        Rotation.from_quat([obj.quaternion for obj in physical_objects])
+        .as_euler("xyz")
+        .tolist()
+        if physical_objects
+        else []
+    )
+
+    positions = np.asarray(
+        [obj.position for obj in physical_objects], dtype=float
+    ).tolist()
+    scales = np.asarray([obj.scale for obj in physical_objects], dtype=float).tolist()
+
     scene_metadata = {
         "scene_index": scene_index,
         "warehouse_dimensions": dims,
         "lighting_conditions": {
-            "ambient_color": list(map(float, scene.ambient_illumination)),
+            "ambient_color": np.asarray(
+                scene.ambient_illumination, dtype=float
+            ).tolist(),
             "num_lights": len([o for o in scene.assets if isinstance(o, kb.Light)]),
         },
         "objects": [
             {
                 "name": obj.name,
-                "position": list(map(float, obj.position)),
-                "scale": list(map(float, obj.scale)),
-                "rotation": list(Rotation.from_quat(obj.quaternion).as_euler("xyz")),
+                "position": position,
+                "scale": scale,
+                "rotation": rotation,
             }
-            for obj in scene.assets
-            if isinstance(obj, kb.PhysicalObject)
+            for obj, position, scale, rotation in zip(
+                physical_objects, positions, scales, rotations
+            )
         ],
     }
     with open(os.path.join(scene_dir, "metadata.json"), "w") as f:
@@ -352,7 +441,9 @@ def generate_warehouse_scenes(
 ):
     """Parallelized scene generation."""
     os.makedirs(output_dir, exist_ok=True)
-    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+    with ProcessPoolExecutor(
+        max_workers=num_workers, initializer=init_worker
+    ) as executor:
         tasks = [
             executor.submit(
                 generate_scene,
@@ -1,9 +1,47 @@
+import functools
 import os
 import logging
 import re
 from kubric.safeimport.bpy import bpy
 
+TEXTURE_MAP_PATTERN = re.compile(
+    r"(?P<map>color|albedo|normal|roughness)", re.IGNORECASE
+)
+TEXTURE_MAP_KEYS = {
+    "color": "color",
+    "albedo": "color",
+    "normal": "normal",
+    "roughness": "roughness",
+}
 
+
+def scan_files(base_path, extensions):
+    """
+    Recursively yields the paths of files with the given extensions, skipping hidden directories.
+    """
+    with os.scandir(base_path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not entry.name.startswith("."):
+                    yield from scan_files(entry.path, extensions)
+            elif entry.name.lower().endswith(extensions):
+                yield entry.path
+
+
+def directory_mtimes(base_path):
+    """
+    Maps every directory scan_files would visit under base_path to its modification time.
+    Adding, removing or renaming a file anywhere in the tree changes one of these times.
+    """
+    mtimes = {base_path: os.stat(base_path).st_mtime}
+    with os.scandir(base_path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False) and not entry.name.startswith("."):
+                mtimes.update(directory_mtimes(entry.path))
+    return mtimes
+
+
+@functools.lru_cache(maxsize=None)
 def discover_assets(base_path, extensions=(".obj", ".glb", ".fbx")):
     """
     Recursively discovers asset files in the specified directory.
@@ -12,15 +50,10 @@ def discover_assets(base_path, extensions=(".obj", ".glb", ".fbx")):
         logging.warning(f"Asset path does not exist: {base_path}")
         return []
 
-    asset_files = []
-    for root, _, files in os.walk(base_path):
-        for file in files:
-            if file.lower().endswith(extensions):
-                asset_files.append(os.path.join(root, file))
-
-    return asset_files
+    return list(scan_files(base_path, extensions))
 
 
+@functools.lru_cache(maxsize=None)
 def discover_textures(base_path):
     """
     Discovers texture sets in the specified directory and groups them into dictionaries.
@@ -29,31 +62,23 @@ def discover_textures(base_path):
         logging.warning(f"Texture path does not exist: {base_path}")
         return []
 
-    texture_files = [
-        os.path.join(root, file)
-        for root, _, files in os.walk(base_path)
-        for file in files
-        if file.lower().endswith((".jpg", ".png"))
-    ]
+    texture_files = list(scan_files(base_path, (".jpg", ".png")))
 
     if not texture_files:
         logging.warning(f"No textures found in {base_path}")
         return []
 
-    patterns = {
-        "color": re.compile(r"(color|albedo)", re.IGNORECASE),
-        "normal": re.compile(r"(normal)", re.IGNORECASE),
-        "roughness": re.compile(r"(roughness)", re.IGNORECASE),
-    }
-
     grouped_textures = {}
     for file in texture_files:
-        for key, pattern in patterns.items():
-            if pattern.search(file):
-                base_name = os.path.basename(file).split("_")[0]
-                if base_name not in grouped_textures:
-                    grouped_textures[base_name] = {}
-                grouped_textures[base_name][key] = file
+        file_name = os.path.basename(file)
+        # Only the file name decides the map, directory names may contain keywords
+        match = TEXTURE_MAP_PATTERN.search(file_name)
+        if match:
+            key = TEXTURE_MAP_KEYS[match.group("map").lower()]
+            base_name = file_name.split("_")[0]
+            if base_name not in grouped_textures:
+                grouped_textures[base_name] = {}
+            grouped_textures[base_name][key] = file
 
     texture_sets = [
         {
@@ -67,11 +92,72 @@ def discover_textures(base_path):
     return texture_sets
 
 
+# Images keyed by path, reused across assets
+_image_cache = {}
+
+
+def clear_texture_caches():
+    """
+    Forgets cached images. Must be called whenever the Blender data is reset.
+    """
+    _image_cache.clear()
+
+
+def remove_unused_data():
+    """
+    Removes data no longer used by any object, e.g. after assets are removed from the scene.
+    Images loaded through load_image stay cached for reuse.
+    """
+    for collection in (
+        bpy.data.meshes,
+        bpy.data.lights,
+        bpy.data.cameras,
+        bpy.data.materials,
+    ):
+        for datablock in list(collection):
+            if datablock.users == 0:
+                collection.remove(datablock)
+
+    cached_images = {image.name for image in _image_cache.values()}
+    for image in list(bpy.data.images):
+        if image.users == 0 and image.name not in cached_images:
+            bpy.data.images.remove(image)
+
+
+def load_image(texture_path):
+    """
+    Loads an image into Blender, reusing the datablock if the path was already loaded.
+    """
+    if texture_path not in _image_cache:
+        # check_existing makes Blender reuse an image already loaded from this path,
+        # e.g. one that outlived a cleared cache
+        _image_cache[texture_path] = bpy.data.images.load(
+            texture_path, check_existing=True
+        )
+    return _image_cache[texture_path]
+
+
 def apply_texture(asset, texture_set, scale):
     """
     Applies textures to a material using Blender nodes with adjustable texture scale.
     """
-    material = bpy.data.materials.new(name=f"{asset.name}_material")
+    material = create_material(f"{asset.name}_material", texture_set, scale)
+
+    # Kubric links each asset to the Blender object created for it, so no scan of
+    # bpy.data.objects is needed
+    for obj in asset.linked_objects.values():
+        if isinstance(obj, bpy.types.Object):
+            if not obj.data.materials:
+                obj.data.materials.append(material)
+            else:
+                obj.data.materials[0] = material
+
+
+def create_material(name, texture_set, scale):
+    """
+    Creates a material from a texture set using Blender nodes with adjustable texture scale.
+    """
+    material = bpy.data.materials.new(name=name)
 
     if not material.use_nodes:
         material.use_nodes = True
@@ -107,7 +193,7 @@ def apply_texture(asset, texture_set, scale):
             return
         texture_node = nodes.new("ShaderNodeTexImage")
         texture_node.location = location
-        texture_node.image = bpy.data.images.load(texture_path)
+        texture_node.image = load_image(texture_path)
         texture_node.image.colorspace_settings.name = (
             "sRGB" if use_color_space else "Non-Color"
         )
@@ -124,9 +210,4 @@ def apply_texture(asset, texture_set, scale):
         texture_set.get("roughness"), "Roughness", (-400, -400), use_color_space=False
     )
 
-    for obj in bpy.data.objects:
-        if obj.name.startswith(asset.name):
-            if not obj.data.materials:
-                obj.data.materials.append(material)
-            else:
-                obj.data.materials[0] = material
+    return material